@@ -35,16 +35,32 @@ Markdown + LaTeX → Notion 批量导入工具
     NOTION_PARENT_PAGE - 目标父页面 ID
 """
 
+import io
 import re
 import os
 import sys
 import json
+import hashlib
 import time
 import argparse
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, islice
 from pathlib import Path
 from typing import Optional
 
+# 可选依赖: orjson 序列化请求体 / 解析响应更快，未安装时回退到标准库 json
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False).encode('utf-8')
+    _json_loads = json.loads
+
 # ============================================================
 # 日志配置
 # ============================================================
@@ -56,6 +72,44 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
+# ============================================================
+# 预编译正则
+# ============================================================
+# 行内公式: $...$（排除 $$）
+_RE_INLINE_MATH = re.compile(r'(?<!\$)\$(?!\$)(.+?)(?<!\$)\$(?!\$)')
+# 行内富文本: 公式 / 加粗 / 斜体 / 代码 / 链接（命名分组，按 lastgroup 分派）
+_RE_RICH = re.compile(
+    r'(?P<eq>\$`[^`]+`\$)'          # 行内数学: $`...`$
+    r'|(?P<bold>\*\*[^*]+\*\*)'     # 加粗: **...**
+    r'|(?P<ital>\*[^*]+\*)'         # 斜体: *...*
+    r'|(?P<code>`[^`]+`)'          # 行内代码: `...`
+    r'|(?P<link>\[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)]+)\))'   # 链接: [text](url)
+)
+_RE_HEADER = re.compile(r'^(#{1,3})\s+(.*)')
+_RE_NUM = re.compile(r'^\d+\.\s+(.*)')
+_RE_NUM_PREFIX = re.compile(r'^\d+\.\s+')
+_RE_TITLE = re.compile(r'^#\s+(.+)', re.MULTILINE)
+_RE_NUMERIC = re.compile(r'^[\d,\.]+$')
+_RE_BLANK = re.compile(r'\n{4,}')
+# 以 $$ 开头的行（允许前导空白，MULTILINE 下逐行匹配）
+_RE_BLOCK_MATH_LINE = re.compile(r'^[^\S\n]*\$\$.*', re.MULTILINE)
+
+# 段落续行的终止条件: 以这些前缀开头或整行等于这些内容时，开始新的 block
+_PARA_STOP_PREFIXES = ('#', '- ', '* ', '> ', '```')
+_PARA_STOP_EXACT = frozenset(('$$', '---', '***', '___'))
+
+
+def _replace_inline_math(match) -> str:
+    """行内公式替换回调"""
+    content = match.group(1)
+    if not content.strip():
+        return match.group(0)
+    # 跳过纯数字金额 ($100, $3.50)，但保留含 LaTeX 的 ($2^{10}$)
+    if content and content[0].isdigit() and _RE_NUMERIC.match(content):
+        return match.group(0)
+    return f'$`{content}`$'
+
+
 # ============================================================
 # LaTeX → Notion Markdown 转换器
 # ============================================================
@@ -63,136 +117,130 @@ log = logging.getLogger(__name__)
 class LatexToNotionConverter:
     """将标准 Markdown+LaTeX 转换为 Notion 兼容格式"""
     
-    def convert(self, markdown_text: str) -> str:
-        """完整转换流程"""
-        text = markdown_text.replace('\r\n', '\n')
-        text = self._convert_block_math(text)
-        text = self._convert_inline_math(text)
-        text = re.sub(r'\n{4,}', '\n\n\n', text)
-        return text.strip()
+    __slots__ = ()
     
-    def _convert_block_math(self, text: str) -> str:
+    def convert(self, markdown_text: str) -> str:
         """
-        转换块级公式为标准多行格式: $$\\n公式\\n$$
-        
-        支持所有常见格式:
+        完整转换流程（单次扫描，同时处理块级公式与行内公式）
+
+        块级公式统一转换为标准多行格式: $$\\n公式\\n$$，支持所有常见格式:
           格式1: $$公式$$          (单行，开闭在同一行)
           格式2: $$\\n公式\\n$$     (标准多行，已是正确格式)
           格式3: $$公式\\n$$        (公式紧跟开头$$，下一行关闭) ← 你的文件用的就是这种！
           格式4: $$\\n公式$$        (公式和关闭$$在同一行)
           格式5: $$公式\\n续行\\n$$ (多行公式，开头$$有内容)
+
+        块级公式以外的行转换行内公式: $...$ → $`...`$
         """
-        lines = text.split('\n')
-        result = []
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i]
+        text = markdown_text.replace('\r\n', '\n')
+        n = len(text)
+        buf = io.StringIO()
+        write = buf.write
+        in_block_math = False
+
+        def emit(line: str):
+            # 输出一行；独立的 $$ 切换块级公式状态，块外的行转换行内公式
+            nonlocal in_block_math
+            if line.strip() == '$$':
+                in_block_math = not in_block_math
+            elif not in_block_math:
+                line = self._convert_inline_math(line)
+            write(line)
+            write('\n')
+
+        def emit_plain(chunk: str):
+            # 输出一段不含 $$ 开头行的连续文本，整段一次正则替换行内公式
+            if in_block_math:
+                write(chunk)
+            elif '$`' in chunk:
+                # 含已转换公式的行需整行跳过，退回逐行处理
+                write('\n'.join(self._convert_inline_math(l) for l in chunk.split('\n')))
+            else:
+                write(_RE_INLINE_MATH.sub(_replace_inline_math, chunk))
+
+        def emit_block(formula: str):
+            emit('')
+            emit('$$')
+            for fl in formula.split('\n'):
+                emit(fl)
+            emit('$$')
+            emit('')
+
+        # 由正则引擎定位 $$ 开头的行，只有这些行需要进入块级公式状态机
+        pos = 0
+        while pos <= n:
+            match = _RE_BLOCK_MATH_LINE.search(text, pos)
+            if match is None:
+                emit_plain(text[pos:])
+                break
+            if match.start() > pos:
+                emit_plain(text[pos:match.start()])
+            
+            line = match.group(0)
             stripped = line.strip()
+            pos = match.end() + 1
+            content_after_open = stripped[2:].strip()
             
-            # 检测 $$ 开头
-            if stripped.startswith('$$'):
-                content_after_open = stripped[2:].strip()
-                
-                # Case 1: $$formula$$ 单行完整 (开闭都在)
-                if content_after_open and content_after_open.endswith('$$'):
-                    formula = content_after_open[:-2].strip()
-                    result.append('')
-                    result.append('$$')
-                    result.append(formula)
-                    result.append('$$')
-                    result.append('')
-                    i += 1
-                    continue
+            # Case 1: $$formula$$ 单行完整 (开闭都在)
+            if content_after_open and content_after_open.endswith('$$'):
+                emit_block(content_after_open[:-2].strip())
+                continue
+            
+            # Case 2: $$ 开头（可能有内容在同行，也可能没有）
+            # 收集公式内容直到找到关闭的 $$
+            math_lines = []
+            if content_after_open:
+                # 格式3/5: $$formula... 
+                math_lines.append(content_after_open)
+            
+            found_closing = False
+            while pos <= n:
+                line_end = text.find('\n', pos)
+                if line_end < 0:
+                    line_end = n
+                next_line = text[pos:line_end]
+                next_stripped = next_line.strip()
                 
-                # Case 2: $$ 开头（可能有内容在同行，也可能没有）
-                # 收集公式内容直到找到关闭的 $$
-                math_lines = []
-                if content_after_open:
-                    # 格式3/5: $$formula... 
-                    math_lines.append(content_after_open)
+                # 关闭: 独立的 $$
+                if next_stripped == '$$':
+                    found_closing = True
+                    pos = line_end + 1
+                    break
                 
-                i += 1
-                found_closing = False
-                while i < len(lines):
-                    next_stripped = lines[i].strip()
-                    
-                    # 关闭: 独立的 $$
-                    if next_stripped == '$$':
-                        found_closing = True
-                        i += 1
-                        break
-                    
-                    # 关闭: 内容后跟 $$ (如 "formula$$")
-                    if next_stripped.endswith('$$') and len(next_stripped) > 2:
-                        math_lines.append(next_stripped[:-2].strip())
-                        found_closing = True
-                        i += 1
-                        break
-                    
-                    # 安全限制: 如果收集超过 30 行还没找到 $$，说明不是块级公式
-                    if len(math_lines) > 30:
-                        break
-                    
-                    math_lines.append(lines[i])
-                    i += 1
+                # 关闭: 内容后跟 $$ (如 "formula$$")
+                if next_stripped.endswith('$$') and len(next_stripped) > 2:
+                    math_lines.append(next_stripped[:-2].strip())
+                    found_closing = True
+                    pos = line_end + 1
+                    break
                 
-                if found_closing and math_lines:
-                    # 成功识别块级公式
-                    result.append('')
-                    result.append('$$')
-                    result.append('\n'.join(math_lines).strip())
-                    result.append('$$')
-                    result.append('')
-                else:
-                    # 未找到关闭 $$ 或没有内容，按原文保留
-                    result.append(line)
-                    for ml in math_lines:
-                        result.append(ml)
+                # 安全限制: 如果收集超过 30 行还没找到 $$，说明不是块级公式
+                if len(math_lines) > 30:
+                    break
                 
-                continue
+                math_lines.append(next_line)
+                pos = line_end + 1
             
-            # 非 $$ 开头的行，原样保留
-            result.append(line)
-            i += 1
+            if found_closing and math_lines:
+                # 成功识别块级公式
+                emit_block('\n'.join(math_lines).strip())
+            else:
+                # 未找到关闭 $$ 或没有内容，按原文保留
+                emit(line)
+                for ml in math_lines:
+                    emit(ml)
         
-        return '\n'.join(result)
+        text = _RE_BLANK.sub('\n\n\n', buf.getvalue())
+        return text.strip()
     
-    def _convert_inline_math(self, text: str) -> str:
+    def _convert_inline_math(self, line: str) -> str:
         """
-        转换行内公式: $...$ → $`...`$
+        转换单行中的行内公式: $...$ → $`...`$
         Notion 使用 $`...`$ 格式渲染行内数学公式
         """
-        lines = text.split('\n')
-        result = []
-        in_block_math = False
-        
-        for line in lines:
-            stripped = line.strip()
-            
-            if stripped == '$$':
-                in_block_math = not in_block_math
-                result.append(line)
-                continue
-            
-            if in_block_math or '$`' in line:
-                result.append(line)
-                continue
-            
-            # 转换 $...$ → $`...`$
-            def replace_inline(match):
-                content = match.group(1)
-                if not content.strip():
-                    return match.group(0)
-                # 跳过纯数字金额 ($100, $3.50)，但保留含 LaTeX 的 ($2^{10}$)
-                if content and content[0].isdigit() and re.match(r'^[\d,\.]+$', content):
-                    return match.group(0)
-                return f'$`{content}`$'
-            
-            line = re.sub(r'(?<!\$)\$(?!\$)(.+?)(?<!\$)\$(?!\$)', replace_inline, line)
-            result.append(line)
-        
-        return '\n'.join(result)
+        if '$`' in line:
+            return line
+        return _RE_INLINE_MATH.sub(_replace_inline_math, line)
 
 
 # ============================================================
@@ -202,6 +250,8 @@ class LatexToNotionConverter:
 class NotionBlockBuilder:
     """将 Notion 兼容 Markdown 转换为 Notion API block 对象"""
     
+    __slots__ = ()
+    
     # Notion API 单个 rich_text content 最大 2000 字符
     MAX_TEXT_LENGTH = 2000
     # Notion API 单次最多 100 个 children blocks
@@ -227,8 +277,8 @@ class NotionBlockBuilder:
         
         # 需要拆分
         result_blocks = []
-        for i in range(0, len(rich_text), self.MAX_RICH_TEXT_ELEMENTS):
-            chunk = rich_text[i:i + self.MAX_RICH_TEXT_ELEMENTS]
+        elements = iter(rich_text)
+        while (chunk := list(islice(elements, self.MAX_RICH_TEXT_ELEMENTS))):
             new_block = {
                 "type": block_type,
                 block_type: {"rich_text": chunk}
@@ -245,11 +295,12 @@ class NotionBlockBuilder:
         """解析 Notion Markdown 为 block 列表"""
         blocks = []
         lines = text.split('\n')
+        stripped_lines = [l.strip() for l in lines]
+        n = len(lines)
         i = 0
         
-        while i < len(lines):
-            line = lines[i]
-            stripped = line.strip()
+        while i < n:
+            stripped = stripped_lines[i]
             
             if not stripped:
                 i += 1
@@ -260,8 +311,8 @@ class NotionBlockBuilder:
                 math_lines = []
                 i += 1
                 found_closing = False
-                while i < len(lines) and len(math_lines) < 50:  # 安全限制
-                    if lines[i].strip() == '$$':
+                while i < n and len(math_lines) < 50:  # 安全限制
+                    if stripped_lines[i] == '$$':
                         found_closing = True
                         i += 1
                         break
@@ -286,7 +337,7 @@ class NotionBlockBuilder:
                 lang = stripped[3:].strip()
                 code_lines = []
                 i += 1
-                while i < len(lines) and not lines[i].strip().startswith('```'):
+                while i < n and not stripped_lines[i].startswith('```'):
                     code_lines.append(lines[i])
                     i += 1
                 i += 1  # 跳过 ```
@@ -306,7 +357,7 @@ class NotionBlockBuilder:
                 continue
             
             # 标题
-            header_match = re.match(r'^(#{1,3})\s+(.*)', stripped)
+            header_match = _RE_HEADER.match(stripped)
             if header_match:
                 level = len(header_match.group(1))
                 block_type = f"heading_{level}"
@@ -321,8 +372,8 @@ class NotionBlockBuilder:
             if stripped.startswith('> '):
                 quote_lines = [stripped[2:]]
                 i += 1
-                while i < len(lines) and lines[i].strip().startswith('> '):
-                    quote_lines.append(lines[i].strip()[2:])
+                while i < n and stripped_lines[i].startswith('> '):
+                    quote_lines.append(stripped_lines[i][2:])
                     i += 1
                 blocks.append({
                     "type": "quote",
@@ -340,7 +391,7 @@ class NotionBlockBuilder:
                 continue
             
             # 有序列表
-            num_match = re.match(r'^\d+\.\s+(.*)', stripped)
+            num_match = _RE_NUM.match(stripped)
             if num_match:
                 blocks.append({
                     "type": "numbered_list_item",
@@ -352,12 +403,10 @@ class NotionBlockBuilder:
             # 普通段落（合并连续行）
             para_lines = [stripped]
             i += 1
-            while i < len(lines):
-                next_s = lines[i].strip()
-                if (not next_s or next_s.startswith('#') or next_s.startswith('- ') or
-                    next_s.startswith('* ') or next_s == '$$' or next_s.startswith('```') or
-                    next_s.startswith('> ') or next_s in ('---', '***', '___') or
-                    re.match(r'^\d+\.\s+', next_s)):
+            while i < n:
+                next_s = stripped_lines[i]
+                if (not next_s or next_s.startswith(_PARA_STOP_PREFIXES) or
+                    next_s in _PARA_STOP_EXACT or _RE_NUM_PREFIX.match(next_s)):
                     break
                 para_lines.append(next_s)
                 i += 1
@@ -368,9 +417,14 @@ class NotionBlockBuilder:
             })
         
         # 拆分超过 100 个 rich_text 元素的 block
+        # 绝大多数 block 不需要拆分，先就地判断，避免逐个调用
         final_blocks = []
         for block in blocks:
-            final_blocks.extend(self._split_block_if_needed(block))
+            rt = block.get(block.get("type", ""), {}).get("rich_text")
+            if rt is None or len(rt) <= self.MAX_RICH_TEXT_ELEMENTS:
+                final_blocks.append(block)
+            else:
+                final_blocks.extend(self._split_block_if_needed(block))
         
         return final_blocks
     
@@ -378,42 +432,15 @@ class NotionBlockBuilder:
         """解析文本为 Notion rich_text 数组（支持行内公式、加粗、斜体、代码、链接）"""
         rich_text = []
         
-        pattern = re.compile(
-            r'(\$`[^`]+`\$)'            # 行内数学: $`...`$
-            r'|(\*\*[^*]+\*\*)'         # 加粗: **...**
-            r'|(\*[^*]+\*)'             # 斜体: *...*
-            r'|(`[^`]+`)'              # 行内代码: `...`
-            r'|(\[[^\]]+\]\([^)]+\))'   # 链接: [text](url)
-        )
-        
         last_end = 0
-        for match in pattern.finditer(text):
+        for match in _RE_RICH.finditer(text):
             # 匹配前的纯文本
             if match.start() > last_end:
                 plain = text[last_end:match.start()]
                 if plain:
                     rich_text.extend(self._chunk_text(plain))
             
-            matched = match.group(0)
-            
-            if matched.startswith('$`') and matched.endswith('`$'):
-                rich_text.append({
-                    "type": "equation",
-                    "equation": {"expression": matched[2:-2]}
-                })
-            elif matched.startswith('**') and matched.endswith('**'):
-                rich_text.extend(self._chunk_text(matched[2:-2], {"bold": True}))
-            elif matched.startswith('*') and matched.endswith('*'):
-                rich_text.extend(self._chunk_text(matched[1:-1], {"italic": True}))
-            elif matched.startswith('`') and matched.endswith('`'):
-                rich_text.extend(self._chunk_text(matched[1:-1], {"code": True}))
-            elif matched.startswith('['):
-                link_match = re.match(r'\[([^\]]+)\]\(([^)]+)\)', matched)
-                if link_match:
-                    rich_text.append({
-                        "type": "text",
-                        "text": {"content": link_match.group(1), "link": {"url": link_match.group(2)}}
-                    })
+            rich_text.extend(self._RICH_HANDLERS[match.lastgroup](self, match))
             
             last_end = match.end()
         
@@ -428,8 +455,48 @@ class NotionBlockBuilder:
         
         return rich_text
     
+    # ---- 行内富文本处理函数: 按 _RE_RICH 的命名分组分派 ----
+    
+    def _rich_equation(self, match) -> list:
+        """行内数学: $`...`$"""
+        return [{"type": "equation", "equation": {"expression": match.group('eq')[2:-2]}}]
+    
+    def _rich_bold(self, match) -> list:
+        """加粗: **...**"""
+        return self._chunk_text(match.group('bold')[2:-2], {"bold": True})
+    
+    def _rich_italic(self, match) -> list:
+        """斜体: *...*"""
+        return self._chunk_text(match.group('ital')[1:-1], {"italic": True})
+    
+    def _rich_code(self, match) -> list:
+        """行内代码: `...`"""
+        return self._chunk_text(match.group('code')[1:-1], {"code": True})
+    
+    def _rich_link(self, match) -> list:
+        """链接: [text](url)"""
+        return [{
+            "type": "text",
+            "text": {"content": match.group('link_text'), "link": {"url": match.group('link_url')}}
+        }]
+    
+    _RICH_HANDLERS = {
+        'eq': _rich_equation,
+        'bold': _rich_bold,
+        'ital': _rich_italic,
+        'code': _rich_code,
+        'link': _rich_link,
+    }
+    
     def _chunk_text(self, content: str, annotations: dict = None) -> list:
         """将超长文本切分为 ≤2000 字符的块"""
+        # 常见情况: 不超长，直接返回单个元素
+        if 0 < len(content) <= self.MAX_TEXT_LENGTH:
+            item = {"type": "text", "text": {"content": content}}
+            if annotations:
+                item["annotations"] = annotations
+            return [item]
+        
         chunks = []
         while content:
             chunk = content[:self.MAX_TEXT_LENGTH]
@@ -445,11 +512,44 @@ class NotionBlockBuilder:
 # Notion API 客户端
 # ============================================================
 
+class _RateLimiter:
+    """跨线程共享的限速器：保证相邻两次请求间隔不小于 min_interval 秒"""
+    
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+    
+    def acquire(self):
+        """阻塞直到允许发出下一次请求"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+    
+    def pause(self, seconds: float):
+        """服务端要求退避时，推迟所有线程的下一次请求"""
+        with self._lock:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+
+
 class NotionClient:
     """Notion API 简易客户端"""
     
+    __slots__ = ('token', 'headers', 'session', '_use_httpx', '_connect_errors', '_transport_errors',
+                 'rate_limiter')
+    
     BASE_URL = "https://api.notion.com/v1"
     API_VERSION = "2022-06-28"
+    # Notion API 平均限速约 3 req/s
+    MIN_REQUEST_INTERVAL = 0.35
+    # 429/5xx/连接失败的重试次数；退避基数（秒），第 n 次重试前等待 base * 2**n
+    MAX_RETRIES = 3
+    RETRY_BASE_DELAY = 1.0
+    # 单次请求超时（秒），两种 HTTP 后端一致
+    REQUEST_TIMEOUT = 30
     
     def __init__(self, token: str):
         self.token = token
@@ -458,12 +558,91 @@ class NotionClient:
             "Content-Type": "application/json",
             "Notion-Version": self.API_VERSION
         }
+        # 复用同一个连接，避免每次请求都重新建立 TCP+TLS 连接。
+        # 安装了 httpx[http2] 时使用 HTTP/2（多线程请求复用同一条连接），否则用 requests
+        try:
+            import httpx
+            self.session = httpx.Client(http2=True, headers=self.headers)
+            self._use_httpx = True
+            self._connect_errors = (httpx.ConnectError, httpx.ConnectTimeout)
+            self._transport_errors = (httpx.HTTPError,)
+        except ImportError:
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            self.session = requests.Session()
+            self.session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20)
+            self.session.mount('https://', adapter)
+            self._use_httpx = False
+            self._connect_errors = (requests.ConnectionError, requests.ConnectTimeout)
+            self._transport_errors = (requests.RequestException,)
+        # 多线程上传时所有请求共享同一个限速器
+        self.rate_limiter = _RateLimiter(self.MIN_REQUEST_INTERVAL)
+    
+    def _request(self, method: str, path: str, **kwargs):
+        """
+        经过限速器发出请求，429 时按 Retry-After 重试；json= 请求体由 _json_dumps 序列化。
+        网络错误时返回 None: 连接失败（请求未到达服务器）会先退避重试；
+        读超时等其他错误时服务器可能已处理该请求，重发会产生重复页面或 blocks，因此不重试。
+        调用方收到 None 时不应再重发或走其他补救路径。
+        """
+        if 'json' in kwargs:
+            # httpx 用 content= 传原始字节，requests 用 data=
+            kwargs['content' if self._use_httpx else 'data'] = _json_dumps(kwargs.pop('json'))
+        for attempt in range(self.MAX_RETRIES):
+            last_attempt = attempt == self.MAX_RETRIES - 1
+            self.rate_limiter.acquire()
+            try:
+                resp = self.session.request(
+                    method, f"{self.BASE_URL}{path}", timeout=self.REQUEST_TIMEOUT, **kwargs
+                )
+            except self._connect_errors as e:
+                log.warning(f"连接失败 {method} {path}: {e}")
+                if last_attempt:
+                    return None
+                time.sleep(self.RETRY_BASE_DELAY * 2 ** attempt)
+                continue
+            except self._transport_errors as e:
+                log.warning(f"请求失败（结果未知，不重试） {method} {path}: {e}")
+                return None
+            if resp.status_code != 429 or last_attempt:
+                return resp
+            # 触发限速: 按 Retry-After 暂停所有线程后重试
+            try:
+                retry_after = float(resp.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0
+            log.warning(f"触发 API 限速，{retry_after:g} 秒后重试...")
+            self.rate_limiter.pause(retry_after)
     
-    def create_page(self, title: str, blocks: list, parent_page_id: str) -> Optional[dict]:
-        """创建 Notion 页面"""
-        import requests
+    def create_page(self, title: str, blocks: list, parent_page_id: str,
+                    on_created=None) -> Optional[dict]:
+        """
+        创建 Notion 页面。
+        on_created 在页面创建请求结束（无论成功与否）、开始追加剩余 blocks 之前调用，
+        供批量上传按输入顺序依次创建页面。
+        """
+        try:
+            created = self._post_page(title, blocks, parent_page_id)
+        finally:
+            if on_created:
+                on_created()
+        if created is None:
+            return None
+        data, remaining, offset = created
         
-        first_batch = blocks[:100]
+        # 追加剩余 blocks；offset 为本批首个 block 在整页中的序号，用于错误定位
+        while (batch := list(islice(remaining, 100))):
+            self._append_blocks(data["id"], batch, title, offset)
+            offset += len(batch)
+        
+        return data
+    
+    def _post_page(self, title: str, blocks: list, parent_page_id: str) -> Optional[tuple]:
+        """发送创建页面请求（带首批 blocks），返回 (页面数据, 待追加的 blocks 迭代器, 其起始序号)"""
+        block_iter = iter(blocks)
+        first_batch = list(islice(block_iter, 100))
         
         body = {
             "parent": {"page_id": parent_page_id},
@@ -473,113 +652,240 @@ class NotionClient:
             "children": first_batch
         }
         
-        resp = requests.post(f"{self.BASE_URL}/pages", headers=self.headers, json=body)
+        resp = self._request("POST", "/pages", json=body)
+        
+        if resp is None:
+            # 页面可能已经创建，不能再走创建空页面的补救路径
+            log.error(f"[{title}] 创建页面失败: {self._describe_failure(resp)}（页面可能已创建，请在 Notion 中确认）")
+            return None
         
         if resp.status_code != 200:
             # 首批也可能失败，尝试先创建空页面再逐批追加
-            log.warning(f"首批 blocks 创建失败，尝试创建空页面后追加...")
+            log.warning(f"[{title}] 首批 blocks 创建失败，尝试创建空页面后追加...")
             body["children"] = []
-            resp = requests.post(f"{self.BASE_URL}/pages", headers=self.headers, json=body)
-            if resp.status_code != 200:
-                log.error(f"创建页面失败: {resp.status_code} - {resp.text}")
+            resp = self._request("POST", "/pages", json=body)
+            if resp is None or resp.status_code != 200:
+                log.error(f"[{title}] 创建页面失败: {self._describe_failure(resp)}")
                 return None
-            data = resp.json()
-            page_id = data["id"]
             # 把所有 blocks 作为 remaining 来追加
-            remaining = blocks
-        else:
-            data = resp.json()
-            page_id = data["id"]
-            remaining = blocks[100:]
-        
-        # 追加剩余 blocks
-        while remaining:
-            batch = remaining[:100]
-            remaining = remaining[100:]
-            self._append_blocks(page_id, batch)
-            time.sleep(0.35)  # API rate limit: ~3 req/s
+            return _json_loads(resp.content), chain(first_batch, block_iter), 0
         
-        return data
+        return _json_loads(resp.content), block_iter, len(first_batch)
     
-    def _append_blocks(self, page_id: str, blocks: list):
-        """追加 blocks 到已有页面，失败时逐个重试"""
-        import requests
-        
+    def _append_blocks(self, page_id: str, blocks: list, title: str, offset: int = 0):
+        """
+        追加 blocks 到已有页面。
+        5xx 时指数退避重试（429 与连接失败已由 _request 重试），仍失败或遇到网络错误则整批记录失败；
+        400 (validation_error) 说明批内有坏 block，二分拆批递归重试，只记录最终单个失败的 block；
+        其余 4xx（401/403/404 等）与具体 block 无关，整批记录失败。
+        """
         body = {"children": blocks}
-        resp = requests.patch(
-            f"{self.BASE_URL}/blocks/{page_id}/children",
-            headers=self.headers, json=body
-        )
-        if resp.status_code == 200:
+        for attempt in range(self.MAX_RETRIES):
+            resp = self._request("PATCH", f"/blocks/{page_id}/children", json=body)
+            if resp is None or resp.status_code < 500:
+                break
+            if attempt < self.MAX_RETRIES - 1:
+                time.sleep(self.RETRY_BASE_DELAY * 2 ** attempt)
+        
+        if resp is not None and resp.status_code == 200:
             return
         
-        # 批量失败 → 逐个重试，避免丢失整批内容
-        log.warning(f"批量追加失败 ({len(blocks)} blocks)，正在逐个重试...")
+        if resp is None or resp.status_code != 400:
+            # 只有 400 (validation_error) 与具体 block 有关；
+            # 网络错误、429/5xx 以及 401/403/404 等页面或 token 问题，拆批无济于事
+            hint = "（可能已追加，请在 Notion 中确认）" if resp is None else ""
+            log.error(f"  ❌ [{title}] Block #{offset}-#{offset + len(blocks) - 1} 追加失败: "
+                      f"{self._describe_failure(resp)}{hint}")
+            return
         
-        for idx, block in enumerate(blocks):
-            body = {"children": [block]}
-            resp = requests.patch(
-                f"{self.BASE_URL}/blocks/{page_id}/children",
-                headers=self.headers, json=body
-            )
-            if resp.status_code != 200:
-                # 提取错误信息
-                try:
-                    err_msg = resp.json().get("message", resp.text)
-                except:
-                    err_msg = resp.text
-                block_type = block.get("type", "unknown")
-                # 尝试获取 block 的文本预览
-                preview = ""
-                inner = block.get(block_type, {})
-                rt = inner.get("rich_text", [])
-                if rt:
-                    first_text = rt[0].get("text", {}).get("content", "") if rt[0].get("type") == "text" else ""
-                    preview = f" | 内容: {first_text[:50]}..."
-                log.error(f"  ❌ Block #{idx} ({block_type}, {len(rt)} rich_text 元素{preview}): {err_msg}")
-            else:
-                time.sleep(0.15)  # rate limit
+        if len(blocks) == 1:
+            self._log_block_error(title, offset, blocks[0], resp)
+            return
+        
+        # 批量失败 → 拆成两半分别重试，避免丢失整批内容
+        mid = len(blocks) // 2
+        log.warning(f"[{title}] 批量追加失败 ({len(blocks)} blocks)，拆分为 {mid} + {len(blocks) - mid} 重试...")
+        self._append_blocks(page_id, blocks[:mid], title, offset)
+        self._append_blocks(page_id, blocks[mid:], title, offset + mid)
+    
+    def _log_block_error(self, title: str, idx: int, block: dict, resp):
+        """记录单个 block 追加失败的原因"""
+        # 提取错误信息
+        try:
+            err_msg = resp.json().get("message", resp.text)
+        except:
+            err_msg = resp.text
+        block_type = block.get("type", "unknown")
+        # 尝试获取 block 的文本预览
+        preview = ""
+        inner = block.get(block_type, {})
+        rt = inner.get("rich_text", [])
+        if rt:
+            first_text = rt[0].get("text", {}).get("content", "") if rt[0].get("type") == "text" else ""
+            preview = f" | 内容: {first_text[:50]}..."
+        log.error(f"  ❌ [{title}] Block #{idx} ({block_type}, {len(rt)} rich_text 元素{preview}): {err_msg}")
     
     def test_connection(self) -> bool:
         """测试 API 连接"""
-        import requests
-        
-        resp = requests.get(f"{self.BASE_URL}/users/me", headers=self.headers)
-        if resp.status_code == 200:
+        resp = self._request("GET", "/users/me")
+        if resp is not None and resp.status_code == 200:
             data = resp.json()
             name = data.get("name", "Unknown")
             log.info(f"✅ API 连接成功！Integration: {name}")
             return True
         else:
-            log.error(f"❌ API 连接失败: {resp.status_code} - {resp.text}")
+            log.error(f"❌ API 连接失败: {self._describe_failure(resp)}")
             return False
+    
+    @staticmethod
+    def _describe_failure(resp) -> str:
+        """失败响应的日志描述；resp 为 None 表示网络错误"""
+        if resp is None:
+            return "网络错误，未收到响应"
+        return f"{resp.status_code} - {resp.text}"
+
+
+# ============================================================
+# 转换结果缓存
+# ============================================================
+
+class _ConversionCache:
+    """
+    转换结果的磁盘缓存，按文件内容 SHA-1 索引，每个条目单独存为 <sha1>.json。
+    内容未变的文件（重试、重复运行）直接复用上次的转换文本和 blocks；
+    超出容量时按修改时间淘汰最久未使用的条目。
+    """
+    
+    DEFAULT_DIR = Path.home() / '.cache' / 'md_to_notion'
+    # 转换逻辑变化时递增，使旧缓存失效
+    VERSION = 1
+    MAX_ENTRIES = 256
+    
+    def __init__(self, cache_dir: Path = None):
+        self.cache_dir = cache_dir or self.DEFAULT_DIR
+    
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[dict]:
+        """命中时返回 {"converted_text": ..., "blocks": [...]}"""
+        path = self.cache_dir / f"{key}.json"
+        try:
+            entry = _json_loads(path.read_bytes())
+            os.utime(path)  # 更新修改时间，标记为最近使用
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != self.VERSION:
+            return None
+        return entry
+    
+    def put(self, key: str, converted_text: str, blocks: list):
+        """写入单个条目，超出容量时淘汰最久未使用的条目"""
+        path = self.cache_dir / f"{key}.json"
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再替换，多线程同时写同一条目也不会读到半个文件
+            tmp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(_json_dumps({
+                "version": self.VERSION,
+                "converted_text": converted_text,
+                "blocks": blocks,
+            }))
+            os.replace(tmp_path, path)
+            self._evict()
+        except OSError as e:
+            log.debug(f"写入缓存失败: {e}")
+    
+    def _evict(self):
+        entries = list(self.cache_dir.glob('*.json'))
+        if len(entries) <= self.MAX_ENTRIES:
+            return
+        mtimes = []
+        for entry in entries:
+            try:
+                mtimes.append((entry.stat().st_mtime, entry))
+            except OSError:
+                pass  # 已被其他线程删除
+        mtimes.sort()
+        for _, entry in mtimes[:len(mtimes) - self.MAX_ENTRIES]:
+            try:
+                entry.unlink()
+            except OSError:
+                pass
 
 
 # ============================================================
 # 批量处理引擎
 # ============================================================
 
+class _PrefetchIterator:
+    """
+    在后台线程池中提前读取后续文件，按顺序产出 (filepath, text)，
+    使磁盘读取与前一个文件的转换重叠进行。读取失败时在对应位置抛出异常。
+    """
+    
+    def __init__(self, filepaths: list, ahead: int = 4):
+        self.filepaths = filepaths
+        self.ahead = ahead
+    
+    def __iter__(self):
+        paths = iter(self.filepaths)
+        with ThreadPoolExecutor(max_workers=self.ahead) as pool:
+            pending = deque(
+                (fp, pool.submit(fp.read_text, encoding='utf-8'))
+                for fp in islice(paths, self.ahead)
+            )
+            while pending:
+                fp, future = pending.popleft()
+                for next_fp in islice(paths, 1):
+                    pending.append((next_fp, pool.submit(next_fp.read_text, encoding='utf-8')))
+                yield fp, future.result()
+
+
 class BatchProcessor:
     """批量处理 Markdown 文件"""
     
-    def __init__(self, token: str = None, parent_page_id: str = None):
+    __slots__ = ('converter', 'builder', 'client', 'parent_page_id', 'cache')
+    
+    # 并发上传的文件数（所有线程共享 NotionClient 的 Session 与限速器）
+    MAX_WORKERS = 3
+    
+    def __init__(self, token: str = None, parent_page_id: str = None, use_cache: bool = True):
         self.converter = LatexToNotionConverter()
         self.builder = NotionBlockBuilder()
         self.client = NotionClient(token) if token else None
         self.parent_page_id = parent_page_id
+        self.cache = _ConversionCache() if use_cache else None
     
-    def process_file(self, filepath: Path, upload: bool = True) -> dict:
-        """处理单个文件"""
+    def process_file(self, filepath: Path, upload: bool = True,
+                     prev_created: threading.Event = None,
+                     created: threading.Event = None) -> dict:
+        """
+        处理单个文件。
+        批量上传时先等待前一个文件的页面创建完成（prev_created），
+        创建完本页面后再通知下一个文件（created），使页面按输入顺序出现在父页面下。
+        """
         log.info(f"📄 处理: {filepath.name}")
         
         # 读取
         text = filepath.read_text(encoding='utf-8')
         
-        # 转换
-        converted = self.converter.convert(text)
-        
-        # 构建 blocks
-        blocks = self.builder.build_blocks(converted)
+        cache_key = _ConversionCache.key_for(text) if self.cache else None
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached:
+            log.debug(f"  ♻️ 使用缓存的转换结果")
+            converted = cached["converted_text"]
+            blocks = cached["blocks"]
+        else:
+            # 转换
+            converted = self.converter.convert(text)
+            
+            # 构建 blocks
+            blocks = self.builder.build_blocks(converted)
+            
+            if self.cache:
+                self.cache.put(cache_key, converted, blocks)
         
         result = {
             "file": str(filepath),
@@ -590,44 +896,86 @@ class BatchProcessor:
         
         # 上传
         if upload and self.client and self.parent_page_id:
-            data = self.client.create_page(result["title"], blocks, self.parent_page_id)
+            if prev_created:
+                prev_created.wait()
+            data = self.client.create_page(
+                result["title"], blocks, self.parent_page_id,
+                on_created=created.set if created else None
+            )
             if data:
                 result["notion_url"] = data["url"]
                 result["notion_id"] = data["id"]
-                log.info(f"  ✅ 已创建: {data['url']}")
+                log.info(f"  ✅ 已创建 {filepath.name}: {data['url']}")
             else:
                 result["error"] = "上传失败"
-                log.error(f"  ❌ 上传失败")
+                log.error(f"  ❌ 上传失败: {filepath.name}")
         
         return result
     
     def process_files(self, filepaths: list, upload: bool = True) -> list:
-        """批量处理多个文件"""
-        results = []
+        """
+        批量处理多个文件（线程池并发转换和追加 blocks，结果按输入顺序返回）。
+        页面创建请求按输入顺序依次发出，保证章节顺序不变。
+        """
         total = len(filepaths)
+        results = [None] * total
+        # created[i] 在第 i 个文件的页面创建请求结束后置位；
+        # 任务按顺序提交、按顺序被线程领取，前一个文件总是先开始，不会互相等死
+        created = [threading.Event() for _ in filepaths]
         
-        for idx, fp in enumerate(filepaths, 1):
-            log.info(f"\n[{idx}/{total}] {'='*50}")
-            result = self.process_file(fp, upload=upload)
-            results.append(result)
-            
-            # Rate limiting
-            if upload and idx < total:
-                time.sleep(0.5)
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            futures = {
+                pool.submit(
+                    self._process_one, fp, upload,
+                    created[idx - 1] if idx else None, created[idx]
+                ): idx
+                for idx, fp in enumerate(filepaths)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                idx = futures[future]
+                results[idx] = future.result()
+                log.info(f"[{done}/{total}] 完成: {filepaths[idx].name}")
         
         return results
     
+    def _process_one(self, filepath: Path, upload: bool,
+                     prev_created: threading.Event, created: threading.Event) -> dict:
+        """线程池任务：处理单个文件，异常转换为失败结果而不中断整批"""
+        try:
+            return self.process_file(filepath, upload=upload,
+                                     prev_created=prev_created, created=created)
+        except Exception as e:
+            log.error(f"  ❌ 处理失败 {filepath.name}: {e}")
+            return {
+                "file": str(filepath),
+                "title": filepath.stem,
+                "blocks_count": 0,
+                "error": str(e),
+            }
+        finally:
+            # 读取/转换失败或不上传时也要放行下一个文件，但仍须排在前一个文件之后
+            if not created.is_set():
+                if prev_created:
+                    prev_created.wait()
+                created.set()
+    
     def _extract_title(self, text: str, filepath: Path) -> str:
         """从 Markdown 提取标题，fallback 到文件名"""
-        # 尝试找 # 标题
-        match = re.search(r'^#\s+(.+)', text, re.MULTILINE)
-        if match:
-            return match.group(1).strip()
-        return filepath.stem
-    
-    def save_converted(self, filepath: Path, output_dir: Path):
-        """仅转换并保存（不上传）"""
-        text = filepath.read_text(encoding='utf-8')
+        # 尝试找 # 标题：用 str.find 直接跳到以 # 开头的行，只在这些行上运行正则
+        pos = 0
+        while True:
+            if text.startswith('#', pos):
+                match = _RE_TITLE.match(text, pos)
+                if match:
+                    return match.group(1).strip()
+            pos = text.find('\n#', pos) + 1
+            if not pos:
+                return filepath.stem
+    
+    def save_converted(self, filepath: Path, output_dir: Path, text: str = None):
+        """仅转换并保存（不上传）；text 为已预读的文件内容"""
+        if text is None:
+            text = filepath.read_text(encoding='utf-8')
         converted = self.converter.convert(text)
         
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -671,6 +1019,7 @@ def main():
     parser.add_argument('-o', '--output', default='./converted', help='转换输出目录 (默认: ./converted)')
     parser.add_argument('--test', action='store_true', help='测试 API 连接')
     parser.add_argument('--dry-run', action='store_true', help='模拟运行，不实际上传')
+    parser.add_argument('--no-cache', action='store_true', help='不使用转换结果缓存 (~/.cache/md_to_notion/)')
     parser.add_argument('--verbose', '-v', action='store_true', help='显示详细输出')
     
     args = parser.parse_args()
@@ -716,8 +1065,8 @@ def main():
     if args.convert_only:
         processor = BatchProcessor()
         output_dir = Path(args.output)
-        for fp in filepaths:
-            processor.save_converted(fp, output_dir)
+        for fp, text in _PrefetchIterator(filepaths):
+            processor.save_converted(fp, output_dir, text)
         log.info(f"\n✅ 转换完成！输出目录: {output_dir}")
         return
     
@@ -733,7 +1082,7 @@ def main():
         sys.exit(1)
     
     # 执行
-    processor = BatchProcessor(token=token, parent_page_id=parent)
+    processor = BatchProcessor(token=token, parent_page_id=parent, use_cache=not args.no_cache)
     
     # 先测试连接
     if not processor.client.test_connection():